@@ -2,11 +2,17 @@
 
 import logging
 import argparse
-import subprocess
+import asyncio
 import os
+import sys
 from pwd import getpwnam
 import hashlib
+import mmap
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from stat import S_ISREG
+from operator import itemgetter
+from itertools import chain, islice
 import re
 
 DESCRIPTION = """
@@ -21,6 +27,12 @@ EPILOG = """
 And that's how you report a ZFS diff.
 """
 
+# stream buffer for reading zfs output; also the longest line it may emit
+PIPEBUFFERSIZE = 1 << 20
+# report file buffer and number of lines joined per write
+WRITEBUFFERSIZE = 1 << 20
+WRITECHUNKLINES = 10000
+
 
 def getArgs():
     parser = argparse.ArgumentParser(description=DESCRIPTION, epilog=EPILOG)
@@ -53,7 +65,14 @@ def getArgs():
     parser.add_argument("-r", "--reduce", action="store_true",
                         help="ZFS lists a file that is deleted and \
                         (re)created between snapshots with - and +; omit \
-                        those lines when the files' checksums match")
+                        those lines when the files' checksums match; \
+                        also for M lines; remaining M lines and -/+ pairs \
+                        get their files' SHA-1 checksums appended unless \
+                        the files differ in size or are no regular files")
+    parser.add_argument("--raw", action="store_true",
+                        help="write the unprocessed zfs diff output \
+                        (unsorted, octal escaped) directly to the report \
+                        files; can't be combined with -f, -e or -r")
     parser.add_argument("--zfsbinary", default="zfs",
                         help="path to ZFS binary; default: 'zfs'")
     parser.add_argument("--debug", action="store_true")
@@ -75,102 +94,218 @@ def handleLogging(args):
 
 # Thanks to https://github.com/hungrywolf27 for that routine
 # https://github.com/schwerpunkt/zfsDiffReport.py/issues/6
+# zfs diff escapes bytes as backslash, zero and three octal digits
+OCTALESCAPE = re.compile(br'\\0([0-3][0-7]{2})')
+OCTALBYTES = {b'%03o' % value: bytes([value]) for value in range(256)}
+
+
 def decode_octal(encoded):
-    # Match b'\\0xxx'
-    for oct_char in (c for c in re.findall(b'\\\\0\d{3}', encoded)):
-        # Figured out through hours of trial and error:
-        # Strip out '\0' to leave b'xxx' of octal number
-        #    br'' means raw bytes (\ not treated as escape)
-        #    Note that it's impossible to create b'\' in Python;
-        #    can't end with a single backslash.
-        myoct = oct_char.replace(br'\0', b'')
-        # Convert this from octal to an integer
-        myint = int(myoct, 8)
-        encoded = encoded.replace(oct_char, bytes([myint]))
-    return encoded
-
-
-def getSnapshots(volume, snapshotkeys):
-    logging.info("Get snapshot list for {}".format(volume))
-    process = subprocess.Popen(
-        ["zfs list -t snapshot -o name -s creation -r {}".format(volume)],
-        shell=True, stdout=subprocess.PIPE)
-    stdout, stderr = process.communicate()
-    zfssnapshots = stdout.decode("utf-8").splitlines()
-
-    tmpZfsSnapshots = zfssnapshots
-    if len(snapshotkeys) > 0:
-        logging.debug("Filter latest snapshots containing {}".format(
-            snapshotkeys[0]))
-        tmpZfsSnapshots = list(
-            filter(lambda x: snapshotkeys[0] in x, zfssnapshots))
-    # if two keys are given, filter by second key excluding the previous result
-    # and push latest from previous filtering to the end
-    # (they will be sorted chronologically later)
-    if len(snapshotkeys) > 1 and len(tmpZfsSnapshots) > 0:
-        logging.debug("Filter latest snapshots containing {}".format(
-            snapshotkeys[1]))
-        tmpZfsSnapshots = list(
-            filter(lambda x: snapshotkeys[1] in x and
-                   not tmpZfsSnapshots[-1] in x,
-                   zfssnapshots)) + [tmpZfsSnapshots[-1]]
-
-    enoughSnapshots = True if len(tmpZfsSnapshots) > 1 else False
-    snapshot1 = tmpZfsSnapshots[-2] if enoughSnapshots else ""
-    snapshot2 = tmpZfsSnapshots[-1] if enoughSnapshots else ""
+    if b'\\' not in encoded:
+        return encoded
+    # replace all escapes in a single pass over the line
+    return OCTALESCAPE.sub(lambda match: OCTALBYTES[match.group(1)], encoded)
+
+
+async def getSnapshotLists(zfsbinary, volumes):
+    logging.info("Get snapshot list for {}".format(", ".join(volumes)))
+    # one zfs list for all volumes; -d 1 skips snapshots of child datasets,
+    # -H omits the header, -p prints written as exact bytes
+    process = await asyncio.create_subprocess_exec(
+        zfsbinary, "list", "-H", "-p", "-t", "snapshot", "-o", "name,written",
+        "-s", "creation", "-d", "1", *volumes,
+        stdout=asyncio.subprocess.PIPE, limit=PIPEBUFFERSIZE)
+    snapshotlists = {volume: [] for volume in volumes}
+    written = {}
+    async for line in process.stdout:
+        snapshot, snapshotwritten = line.decode("utf-8").rstrip("\n").split(
+            "\t")
+        snapshotlists.setdefault(snapshot.split("@", 1)[0], []).append(
+            snapshot)
+        written[snapshot] = int(snapshotwritten)\
+            if snapshotwritten.isdigit() else None
+    await process.wait()
+    return snapshotlists, written
+
+
+async def getMountpoints(zfsbinary, volumes):
+    logging.info("Get mountpoints for {}".format(", ".join(volumes)))
+    process = await asyncio.create_subprocess_exec(
+        zfsbinary, "list", "-H", "-o", "name,mountpoint,mounted", *volumes,
+        stdout=asyncio.subprocess.PIPE, limit=PIPEBUFFERSIZE)
+    mountpoints = {}
+    async for line in process.stdout:
+        volume, mountpoint, mounted = line.decode("utf-8").rstrip(
+            "\n").split("\t")
+        # unmounted volumes have no snapshot files to hash
+        if mounted != "yes":
+            continue
+        if mountpoint.startswith("/"):
+            # no trailing slash for the pool root "/" so paths join cleanly
+            mountpoints[volume] = mountpoint.rstrip("/")
+        else:  # legacy mountpoint, assume the default one
+            mountpoints[volume] = "/{}".format(volume)
+    await process.wait()
+    return mountpoints
+
+
+def hasChanges(zfssnapshots, written, index1, index2):
+    # a snapshot's written property is the data written since the previous
+    # snapshot; if nothing was written up to snapshot2 zfs diff is empty
+    return any(written.get(snapshot) != 0
+               for snapshot in zfssnapshots[index1+1:index2+1])
+
+
+def getSnapshots(volume, zfssnapshots, snapshotkeys):
+    # no keyword matches every snapshot, one keyword is used for both
+    # snapshots, with two keywords the latest snapshot containing the first
+    # and the latest other snapshot containing the second are diffed
+    firstkey = snapshotkeys[0] if len(snapshotkeys) > 0 else ""
+    secondkey = snapshotkeys[-1] if len(snapshotkeys) > 0 else ""
+    logging.debug("Find latest snapshots containing '{}' and '{}'".format(
+        firstkey, secondkey))
+
+    # walk from the latest snapshot back and stop once both are found
+    firstindex = None
+    secondindex = None
+    for index in range(len(zfssnapshots)-1, -1, -1):
+        if firstindex is None and firstkey in zfssnapshots[index]:
+            firstindex = index
+        elif secondindex is None and secondkey in zfssnapshots[index]:
+            secondindex = index
+        if firstindex is not None and secondindex is not None:
+            break
+
+    enoughSnapshots = firstindex is not None and secondindex is not None
     if not enoughSnapshots:
         logging.critical("ERROR: Not enough snapshots in volume {} \
 for given snapshot keys {}".format(volume,
                                    snapshotkeys if len(snapshotkeys) > 0
                                    else ""))
+        return enoughSnapshots, None, None
 
-    # sort snapshots chronologically
-    if ((enoughSnapshots) and
-       (zfssnapshots.index(snapshot1) > zfssnapshots.index(snapshot2))):
-        tmpSnapshot = snapshot2
-        snapshot2 = snapshot1
-        snapshot1 = tmpSnapshot
-
-    return enoughSnapshots, snapshot1, snapshot2
+    # zfssnapshots is sorted chronologically, return the older one first
+    return (enoughSnapshots, min(firstindex, secondindex),
+            max(firstindex, secondindex))
 
 
-def getSortedDiffLines(snapshot1, snapshot2):
+async def getSortedDiffLines(zfsbinary, snapshot1, snapshot2, excludes):
     logging.info("Create zfs diff of snapshots {} and {}".format(
         snapshot1, snapshot2))
-    process = subprocess.Popen(["zfs diff {} {}".format(
-        snapshot1, snapshot2)], shell=True, stdout=subprocess.PIPE)
-    stdout, stderr = process.communicate()
-    
-    # decode octal values created by zfs diff
-    difflines = decode_octal(stdout)
-    difflines = difflines.decode("utf-8")
-
-    difflines = difflines.splitlines()
-
-    # sorting difflines by second column
-    return sorted(difflines, key=lambda x: x.split()[1])
-
-
-def getFilteredDifflines(difflines, excludes):
-    if excludes:
-            logging.info("Exclude lines containing '{}'".format(
-                " or ".join(excludes)))
-            difflines = list(filter(
-                lambda x: not any(f in x for f in excludes), difflines))
+    excludepattern = getExcludePattern(excludes)
+    process = await asyncio.create_subprocess_exec(
+        zfsbinary, "diff", snapshot1, snapshot2,
+        stdout=asyncio.subprocess.PIPE, limit=PIPEBUFFERSIZE)
+
+    # consume zfs diff line by line instead of buffering its whole output,
+    # decode octal values created by zfs diff and drop excluded lines on the
+    # way so they are never collected; lines stay bytes up to the report file
+    difflines = []
+    async for line in process.stdout:
+        line = decode_octal(line).rstrip(b"\n")
+        if excludepattern is None or not excludepattern.search(line):
+            difflines.append(line)
+    if await process.wait() != 0:
+        logging.critical("ERROR: zfs diff of snapshots {} and {} \
+failed".format(snapshot1, snapshot2))
+        return None
+
+    # sorting difflines by path; zfs diff lines are "<change type>\t<path>"
+    # so the path always starts at the third character
+    # (UTF-8 byte order equals code point order)
+    difflines.sort(key=itemgetter(slice(2, None)))
     return difflines
 
 
-def getHash(file):
-    if Path(file).is_dir():
-        return ""
-    if not Path(file).is_file():
-        return ""
-    # code from : https://stackoverflow.com/q/3431825/#tab-top
-    hash_alg = hashlib.sha1()
-    with open(file, "rb") as f:
-        for chunk in iter(lambda: f.read(4096), b""):
-            hash_alg.update(chunk)
-    return hash_alg.hexdigest()
+def getExcludePattern(excludes):
+    if not excludes:
+        return None
+    logging.info("Exclude lines containing '{}'".format(
+        " or ".join(excludes)))
+    # a single alternation matches all keywords in one pass over a line
+    return re.compile(b"|".join(re.escape(os.fsencode(f)) for f in excludes))
+
+
+def newHash():
+    # checksums only compare file versions, flagging them as not security
+    # relevant keeps OpenSSL on its fast path (also in FIPS mode)
+    return hashlib.new("sha1", usedforsecurity=False)
+
+
+def getHash(file, size):
+    # file is a regular file of given size, getHashes already stat'ed it;
+    # unbuffered, mmap and file_digest work on the file descriptor anyway
+    hash_alg = newHash()
+    # empty files can't be mapped and keep the initial digest
+    if size == 0:
+        return hash_alg.hexdigest().encode("ascii")
+    with open(file, "rb", buffering=0) as f:
+        try:
+            # map the file so a single update hashes it in C
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                hash_alg.update(mm)
+        except (OSError, ValueError):
+            if not hasattr(hashlib, "file_digest"):  # python 3.11+
+                raise
+            # file can't be mapped, read it in chunks instead
+            hash_alg = hashlib.file_digest(f, newHash)
+    return hash_alg.hexdigest().encode("ascii")
+
+
+def getFileSize(file):
+    # size of a regular file, None for directories and missing files
+    try:
+        st = os.stat(file)
+    except OSError:
+        return None
+    return st.st_size if S_ISREG(st.st_mode) else None
+
+
+def getDiffPath(line, mountpoint):
+    # path of a "<change type>\t<path>" diff line relative to the mountpoint,
+    # None for paths outside of it
+    if not line.startswith(mountpoint, 2):
+        return None
+    return line[2+len(mountpoint):]
+
+
+def getHashes(difflines, mountpoint, snapshot1, snapshot2, executor):
+    # collect every file the reduction may compare and hash them in the
+    # shared thread pool; file reads and hashlib release the GIL so the reads
+    # overlap
+    files = set()
+    sizes = {}
+
+    def addFilePair(file1, file2):
+        for file in (file1, file2):
+            if file not in sizes:
+                sizes[file] = getFileSize(file)
+        # files of different size can't match, skip hashing them
+        if (sizes[file1] is None or sizes[file2] is None or
+           sizes[file1] == sizes[file2]):
+            files.update((file1, file2))
+
+    for index, line in enumerate(difflines):
+        if line.startswith(b"M") and len(line) > 3:
+            mfile = getDiffPath(line, mountpoint)
+            if mfile is not None:
+                addFilePair(snapshot1+mfile, snapshot2+mfile)
+        elif (index+1 < len(difflines) and
+              ((line.startswith(b"-") and
+                difflines[index+1].startswith(b"+")) or
+               (line.startswith(b"+") and
+                difflines[index+1].startswith(b"-")))):
+            mfile = getDiffPath(line, mountpoint)
+            pfile = getDiffPath(difflines[index+1], mountpoint)
+            if mfile is not None and mfile == pfile:
+                addFilePair(snapshot1+mfile, snapshot2+pfile)
+
+    # no checksum for directories and missing files
+    hashes = dict.fromkeys(files, b"")
+    files = [file for file in files if sizes[file] is not None]
+    logging.debug("Hashing {} files".format(len(files)))
+    hashes.update(zip(files, executor.map(
+        getHash, files, [sizes[file] for file in files])))
+    return hashes
 
 
 def getReducedDifflines(
@@ -178,71 +313,256 @@ def getReducedDifflines(
   stripVolumePath,
   mountpoint,
   snapshot1,
-  snapshot2):
+  snapshot2,
+  executor):
     zfsstructure = "/.zfs/snapshot/"
     snapshot1 = mountpoint+zfsstructure+snapshot1.split("@")[1]
     snapshot2 = mountpoint+zfsstructure+snapshot2.split("@")[1]
     logging.debug("Reduce lines after hashing files from\n\
 {} and\n{}\nstripVolumePath {}".format(
                       snapshot1, snapshot2, stripVolumePath))
-
-    reduceddifflines = []
+    # difflines are bytes, so are the paths matched against them
+    mountpoint = os.fsencode(mountpoint)
+    snapshot1 = os.fsencode(snapshot1)
+    snapshot2 = os.fsencode(snapshot2)
+
+    # files missing in hashes differ in size and were not hashed
+    hashes = getHashes(difflines, mountpoint, snapshot1, snapshot2, executor)
+    return generateReducedDifflines(
+        difflines,
+        hashes,
+        stripVolumePath,
+        mountpoint,
+        snapshot1,
+        snapshot2)
+
+
+def generateReducedDifflines(
+  difflines,
+  hashes,
+  stripVolumePath,
+  mountpoint,
+  snapshot1,
+  snapshot2):
+    # yields the reduced lines while the report is written instead of
+    # collecting a second list of all lines
+    lastindex = len(difflines)-1
+    renamemountpoint = b" -> "+mountpoint
     mreduced = False
     for index, line in enumerate(difflines):
         # TODO write separate reduced line file maybe
 
         if mreduced:
             mreduced = False
-            logging.debug("Reducing line {}".format(line))
+            logging.debug("Reducing line {}".format(os.fsdecode(line)))
             continue
 
-        if line.startswith("M") and len(line) > 3:
-            mfile = line.split("{}".format(mountpoint))[1]
-            mhash1 = getHash(snapshot1+mfile)
-            mhash2 = getHash(snapshot2+mfile)
-            line = "{} {} {}".format(line, mhash1, mhash2)
-            if mhash1 == mhash2:
-                logging.debug("Reducing line {}".format(line))
-                continue
+        if line.startswith(b"M") and len(line) > 3:
+            mfile = getDiffPath(line, mountpoint)
+            mhash1 = None if mfile is None else hashes.get(snapshot1+mfile)
+            mhash2 = None if mfile is None else hashes.get(snapshot2+mfile)
+            if mhash1 is not None and mhash2 is not None:
+                line = b" ".join((line, mhash1, mhash2))
+                if mhash1 == mhash2:
+                    logging.debug("Reducing line {}".format(os.fsdecode(line)))
+                    continue
 
-        elif (index+1 < len(difflines) and
-              ((line.startswith("-") and difflines[index+1].startswith("+")) or
-               (line.startswith("+") and difflines[index+1].startswith("-")))):
-            mfile = line.split("{}".format(mountpoint))[1]
-            pfile = difflines[index+1].split("{}".format(mountpoint))[1]
-            if mfile == pfile:
-                mhash = getHash(snapshot1+mfile)
-                phash = getHash(snapshot1+pfile)
-                line = "{} {}".format(line, mhash)
-                difflines[index+1] = "{} {}".format(difflines[index+1], phash)
+        elif (index < lastindex and
+              ((line.startswith(b"-") and
+                difflines[index+1].startswith(b"+")) or
+               (line.startswith(b"+") and
+                difflines[index+1].startswith(b"-")))):
+            mfile = getDiffPath(line, mountpoint)
+            pfile = getDiffPath(difflines[index+1], mountpoint)
+            mhash = None
+            phash = None
+            if mfile is not None and mfile == pfile:
+                # the removed file is in snapshot1, the created one in
+                # snapshot2
+                msnapshot, psnapshot = ((snapshot1, snapshot2)
+                                        if line.startswith(b"-")
+                                        else (snapshot2, snapshot1))
+                mhash = hashes.get(msnapshot+mfile)
+                phash = hashes.get(psnapshot+pfile)
+            if mhash is not None and phash is not None:
+                line = b" ".join((line, mhash))
+                difflines[index+1] = b" ".join((difflines[index+1], phash))
                 if mhash == phash:
-                    logging.debug("Reducing line {}".format(line))
+                    logging.debug("Reducing line {}".format(os.fsdecode(line)))
                     mreduced = True
                     continue
 
         if stripVolumePath:
             # strip mountpoint from paths
-            line = line.replace(mountpoint, "", 1)
+            line = line.replace(mountpoint, b"", 1)
             # strip for zfs renames R
-            line = line.replace(" -> {}".format(mountpoint), " -> ", 1)
-
-        line = " ".join(line.split())
+            line = line.replace(renamemountpoint, b" -> ", 1)
 
-        reduceddifflines.append(line)
+        line = b" ".join(line.split())
 
-    return reduceddifflines
+        yield line
 
 
-def writeReport(difflines, outdir, outfile, outfilesuffix, user):
+def writeReport(difflines, outdir, outfile, outfilesuffix, owner):
     outpath = outdir+"/"+outfile+outfilesuffix
     logging.info("Write to {}".format(outpath))
-    file = open(outpath, "w")
-    file.write("\n".join(difflines))
-    file.close()
+    with open(outpath, "wb", buffering=WRITEBUFFERSIZE) as file:
+        # join in chunks so large reports aren't held in memory twice;
+        # difflines may be any iterable and is consumed as it is written
+        difflines = iter(difflines)
+        separator = b""
+        chunk = list(islice(difflines, WRITECHUNKLINES))
+        while chunk:
+            file.write(separator)
+            file.write(b"\n".join(chunk))
+            separator = b"\n"
+            chunk = list(islice(difflines, WRITECHUNKLINES))
+
+        if owner:
+            logging.debug("Setting owner uid {} gid {}".format(*owner))
+            os.fchown(file.fileno(), *owner)
+
+
+async def writeRawReport(
+  zfsbinary,
+  snapshot1,
+  snapshot2,
+  outdir,
+  outfile,
+  outfilesuffix,
+  owner):
+    outpath = outdir+"/"+outfile+outfilesuffix
+    logging.info("Write zfs diff of snapshots {} and {} to {}".format(
+        snapshot1, snapshot2, outpath))
+    with open(outpath, "wb") as file:
+        # like the other reports, leave no empty or truncated file behind
+        try:
+            # zfs diff writes straight into the report file, its output never
+            # passes through python
+            process = await asyncio.create_subprocess_exec(
+                zfsbinary, "diff", snapshot1, snapshot2, stdout=file)
+            if await process.wait() != 0:
+                logging.critical("ERROR: zfs diff of snapshots {} and {} \
+failed".format(snapshot1, snapshot2))
+                os.unlink(outpath)
+                return False
+
+            if owner:
+                logging.debug("Setting owner uid {} gid {}".format(*owner))
+                os.fchown(file.fileno(), *owner)
+            return True
+        except BaseException:
+            os.unlink(outpath)
+            raise
+
+
+def getOutfile(volume, snapshot1, snapshot2, snapshotkeys):
+    # snapshots found with same keyword: shorten the second name to
+    # what follows the keyword
+    # TODO reduce output string length if possible
+    #      for when two snapshot keys are given
+    separator = snapshotkeys[0] if len(snapshotkeys) == 1 else "@"
+    return "{}_{}-{}".format(
+        volume.replace("/", "_"),
+        snapshot1.rpartition("@")[2],
+        snapshot2.rpartition(separator)[2])
+
+
+async def processVolume(
+  volume,
+  zfssnapshots,
+  written,
+  mountpoint,
+  volumes,
+  executor,
+  args):
+    getSnapshotsSuccess, index1, index2 = getSnapshots(
+        volume,
+        zfssnapshots,
+        args.snapshotkeys)
+    if not getSnapshotsSuccess:
+        return None
+    snapshot1 = zfssnapshots[index1]
+    snapshot2 = zfssnapshots[index2]
+
+    if not hasChanges(zfssnapshots, written, index1, index2):
+        logging.info("No data written between snapshots {} and {}, skip \
+zfs diff".format(snapshot1, snapshot2))
+        difflines = []
+    elif args.raw:
+        writeRawReportSuccess = await writeRawReport(
+            args.zfsbinary,
+            snapshot1,
+            snapshot2,
+            args.outdir,
+            getOutfile(volume, snapshot1, snapshot2, args.snapshotkeys),
+            args.outfilesuffix,
+            args.owner)
+        return [] if writeRawReportSuccess else None
+    else:
+        difflines = await getSortedDiffLines(
+            args.zfsbinary,
+            snapshot1,
+            snapshot2,
+            args.exclude)
+        if difflines is None:
+            return None
+
+    # without diff lines there is nothing to hash
+    if args.reduce and difflines:
+        if mountpoint is None:
+            logging.critical("ERROR: Volume {} is not mounted, can't compare \
+its files".format(volume))
+            return None
+        stripVolumePath = False if args.filename and len(volumes) > 1\
+                    else True
+        # hashing blocks, keep the event loop free for the other volumes;
+        # the reduced lines are generated lazily when the report is written
+        difflines = await asyncio.to_thread(
+            getReducedDifflines,
+            difflines,
+            stripVolumePath,
+            mountpoint,
+            snapshot1,
+            snapshot2,
+            executor)
+
+    if not args.filename:  # report to separate files
+        writeReport(
+            difflines,
+            args.outdir,
+            getOutfile(volume, snapshot1, snapshot2, args.snapshotkeys),
+            args.outfilesuffix,
+            args.owner)
+
+    return difflines
 
-    if user:
-        logging.debug("Setting user for user {}".format(user))
-        os.chown(outpath, getpwnam(user).pw_uid, getpwnam(user).pw_gid)
+
+async def processVolumes(volumes, args):
+    # only the reduction reads files below the mountpoints
+    if args.reduce:
+        (snapshotlists, written), mountpoints = await asyncio.gather(
+            getSnapshotLists(args.zfsbinary, volumes),
+            getMountpoints(args.zfsbinary, volumes))
+    else:
+        snapshotlists, written = await getSnapshotLists(
+            args.zfsbinary, volumes)
+        mountpoints = {}
+    # zfs diff of all volumes run concurrently; their files are hashed in
+    # one pool so the number of concurrent reads doesn't grow with the
+    # number of volumes
+    workers = min(32, (os.cpu_count() or 1)*4)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return await asyncio.gather(
+            *[processVolume(
+                volume,
+                snapshotlists[volume],
+                written,
+                mountpoints.get(volume),
+                volumes,
+                executor,
+                args)
+              for volume in volumes])
 
 
 def main():
@@ -265,9 +585,16 @@ def main():
         logging.critical("ERROR: too many snapshotkeys given {} (max 2)".format(args.snapshotkeys))
         return
 
+    if args.raw and (args.filename or args.exclude or args.reduce):
+        logging.critical("ERROR: --raw can't be combined with -f, -e or -r")
+        return
+
+    # resolve the report owner once instead of for every written report
+    args.owner = None
     try:
         if args.user:
-            getpwnam(args.user)
+            pw = getpwnam(args.user)
+            args.owner = (pw.pw_uid, pw.pw_gid)
     except KeyError:
         logging.critical("ERROR: Given user does not exist")
         return
@@ -282,60 +609,33 @@ def main():
     # remove volume duplicates
     volumes = list(set(args.volume))
 
-    collecteddifflines = []
-    errors = 0
-    for volume in volumes:
-        mountpoint = "/{}".format(volume)  # TODO get actual mountpoint
-        getSnapshotsSuccess, snapshot1, snapshot2 = getSnapshots(
-            volume,
-            args.snapshotkeys)
-        if not getSnapshotsSuccess:
-            errors += 1
-            continue
-
-        difflines = getSortedDiffLines(snapshot1, snapshot2)
-        difflines = getFilteredDifflines(difflines, args.exclude)
-        if args.reduce:
-            stripVolumePath = False if args.filename and len(volumes) > 1\
-                        else True
-            difflines = getReducedDifflines(
-                difflines,
-                stripVolumePath,
-                mountpoint,
-                snapshot1,
-                snapshot2)
-
-        collecteddifflines = collecteddifflines + difflines
-
-        if args.filename:
-            if volume == volumes[-1]:
-                if args.filename == " ":  # report to stdout
-                    logging.info("Report to stdout")
-                    print("\n".join(collecteddifflines))
-                else:
-                    outfile = args.filename
-                    writeReport(
-                        collecteddifflines,
-                        args.outdir,
-                        outfile,
-                        args.outfilesuffix,
-                        args.user)
-        else:  # report to separate files
-            outfile = volume.replace("/", "_")+"_"+snapshot1.rsplit("@", 1)[1]
-            if len(args.snapshotkeys) == 1:
-                # snapshots found with same keyword
-                outfile = outfile+"-"+snapshot2.rsplit(
-                    args.snapshotkeys[0], 1)[1]
-            # elif 0: # TODO reduce output string length if possible
-            #        # for when two snapshot keys are given
-            else:
-                outfile = outfile+"-"+snapshot2.rsplit("@", 1)[1]
+    try:
+        results = asyncio.run(processVolumes(volumes, args))
+    except FileNotFoundError as error:
+        if error.filename != args.zfsbinary:
+            raise
+        logging.critical("ERROR: ZFS binary {} not found".format(
+            args.zfsbinary))
+        return
+    errors = results.count(None)
+
+    if args.filename:
+        # chain the volumes' lines instead of copying them into one list
+        collecteddifflines = chain.from_iterable(
+            difflines for difflines in results if difflines is not None)
+        if args.filename == " ":  # report to stdout
+            logging.info("Report to stdout")
+            sys.stdout.flush()
+            sys.stdout.buffer.writelines(
+                line+b"\n" for line in collecteddifflines)
+        else:
+            outfile = args.filename
             writeReport(
-                difflines,
+                collecteddifflines,
                 args.outdir,
                 outfile,
                 args.outfilesuffix,
-                args.user)
+                args.owner)
 
     if errors == 0:
         logging.debug("Success")